@@ -10,6 +10,9 @@ This solution uses a very simple model (but it's enough to decode the message):
     * 2 letter bigram probabilities built from a list of words (around 260,000 words).
     * Naïve Bayes assumption: P(bg_1, bg_2... bg_n) = Product(i:1..n) P(bg_i).
 
+Before scoring, candidates can be pruned with a dictionary index built from the
+same word list: shifts whose words are mostly not in the dictionary are discarded.
+
 Requirements:
     * Python 3.x
 """
@@ -54,29 +57,69 @@ class RotationCipher:
         return "".join([self.rotate_char(c, shift) for c in text.lower()])
 
 
+def load_words():
+    """Read the (lowercase) word list, using a pickled copy if available"""
+    cwd = os.path.dirname(__file__)
+    words_p = os.path.join(cwd, ".words.p")
+
+    if os.path.isfile(words_p):
+        return pickle.load(open(words_p, "rb"))
+
+    words = []
+    with open(os.path.join(cwd, "sowpods.txt"), "r") as f:
+        for line in iter(f.readline, ''):
+            words.append(line.lower().rstrip())
+    pickle.dump(words, open(words_p, "wb"))
+    return words
+
+
+class DictionaryIndex:
+    """Index of the word list for fast dictionary lookups.
+
+    Words are kept in a frozenset, so checking a word is a single hash lookup.
+    The index is built once and shared by all instances.
+    """
+
+    _cache = None
+
+    def __init__(self):
+        if DictionaryIndex._cache is None:
+            start_time = time.time()
+            words = load_words()
+            DictionaryIndex._cache = frozenset(words)
+            logging.debug('Built dictionary index in: %f', (time.time() - start_time))
+
+        self.words = DictionaryIndex._cache
+
+    def __contains__(self, word):
+        return word in self.words
+
+    def coverage(self, phrase):
+        """Fraction of the letters of the phrase that belong to dictionary words"""
+        letters = covered = 0
+        for word in phrase.split():
+            letters += len(word)
+            if word in self.words:
+                covered += len(word)
+        return covered / letters if letters else 0
+
+    def coverages(self, phrases):
+        """Dictionary coverage of each phrase"""
+        return [self.coverage(phrase) for phrase in phrases]
+
+
 class LetterBigrams(ProbabilisticModel):
     """Create letter bigrams from a word list"""
 
     def __init__(self, alphabet=ALPHABET_EN):
         self.alphabet = alphabet
-        cwd = os.path.dirname(__file__)
-        self.__words_file = os.path.join(cwd, "sowpods.txt")
-        self.__words_p = os.path.join(cwd, ".words.p")
-
         super().__init__(".prob_letter_model.p")
 
     def build_probabilistic_model(self):
         """Create letter bigrams, count their ocurrences and calculate their probabilities"""
         start_time = time.time()
 
-        if os.path.isfile(self.__words_p):
-            self.words = pickle.load(open(self.__words_p, "rb"))
-        else:
-            self.words = []
-            with open(self.__words_file, "r") as f:
-                for line in iter(f.readline, ''):
-                    self.words.append(line.lower().rstrip())
-                pickle.dump(self.words, open(self.__words_p, "wb"))
+        self.words = load_words()
 
         words = ' '.join(self.words)
         # TODO: could make it generic, for N-grams, with itertools.permutations
@@ -117,6 +160,19 @@ def most_probable(phrases):
 
     return sorted(results, key=lambda val: val[0], reverse=True)
 
+def prune(phrases, threshold=0.5, index=None):
+    """Discard the phrases with low dictionary coverage (keep at least the best one)"""
+    index = index if index else DictionaryIndex()
+    phrases = list(phrases)
+    coverages = index.coverages(phrases)
+
+    candidates = [p for (p, c) in zip(phrases, coverages) if c >= threshold]
+    if not candidates and phrases:
+        candidates = [max(zip(phrases, coverages), key=lambda val: val[1])[0]]
+
+    logging.debug("Pruned %d of %d phrases", len(phrases) - len(candidates), len(phrases))
+    return candidates
+
 def main():
     # Text cleanup: remove punctuation characters, etc.
     text = re.sub("[^a-z ]", "", TEXT.lower())
@@ -124,11 +180,13 @@ def main():
     rotation_cipher = RotationCipher()
     all_phrases = (rotation_cipher.encode(text, x) for x in range(0, 26))
 
-    # Figure out the probability of each possible shift
-    sorted_phrases = most_probable(all_phrases)
+    # Discard the shifts that are clearly wrong, and figure out the
+    # probability of each of the remaining ones
+    sorted_phrases = most_probable(prune(all_phrases))
     print("Most probable phrase: %s" % sorted_phrases[0][1])
     print("With probability: %.4e" % sorted_phrases[0][0])
-    print("Second best probability: %.4e" % sorted_phrases[1][0])
+    if len(sorted_phrases) > 1:
+        print("Second best probability: %.4e" % sorted_phrases[1][0])
 
 if __name__ == "__main__":
     main()
@@ -10,17 +10,26 @@ This solution uses the following probabilistic model:
     * Word unigrams.
     * Naïve Bayes assumption: P(w_1, w_2... w_n) = Product(i:1..n) P(w_i).
 
+Strips from many documents can be reassembled at once: they are grouped into
+documents by row count and by chaining the strips with a model of letter n-grams
+built from the word list, and each group is then ordered in parallel.
+
 Requirements:
     * Python 3.x
 """
 
 from probabilistic_model import ProbabilisticModel
+from rotation_cipher_plm import load_words
+import collections
 import functools
+import heapq
 import logging
+import multiprocessing
 import os.path
 import math
 import pickle
 import re
+import string
 import time
 
 # Logging level
@@ -139,14 +148,18 @@ class WordUnigrams(ProbabilisticModel):
         except KeyError:
             return self.default_prob["p"]
 
-def most_probable(text=TEXT, cols=19, rows=8):
-    word_model = WordUnigrams()
+def most_probable(text=TEXT, cols=19, rows=8, columns=None, unigrams=None):
+    word_model = unigrams if unigrams else WordUnigrams()
     results = []
 
     # Pick admissible columns for the first one, figure out the best order for
     # each, and choose the one with the highest probability
     for i in range(cols):
-        shuffled_text = ShuffledText(text=text, unigrams=word_model, cols=cols, rows=rows)
+        if columns:
+            shuffled_text = ShuffledText(columns=[list(c) for c in columns], text=None,
+                    unigrams=word_model, cols=cols, rows=rows)
+        else:
+            shuffled_text = ShuffledText(text=text, unigrams=word_model, cols=cols, rows=rows)
         start_col = shuffled_text.remove_column(i)
         # Discard columns that have rows that start with spaces
         if [r for r in start_col if r.startswith(' ')]:
@@ -173,6 +186,458 @@ def most_probable(text=TEXT, cols=19, rows=8):
 
     return sorted(results, key=lambda res: res[0], reverse=True)
 
+class LetterNgrams(ProbabilisticModel):
+    """Letter n-grams of the words in the word list, a model of the rows of a text.
+
+    Inside a word, the next letter depends on the last n - 1 letters of the word,
+    interpolated with the shorter contexts. A space ends the word, a second space
+    starts the padding at the end of the line, and any other character (punctuation,
+    digits) is a '.' at the edge of a word.
+    """
+
+    n = 6
+    # Probabilities of the line ending after a word, of punctuation after a word, of a
+    # letter after the padding and of a line broken before a word that fits in it
+    line_end = 0.2
+    punctuation = 0.1
+    overflow = 0.001
+    wrong_break = 0.01
+
+    def __init__(self, k=1):
+        super().__init__(".prob_ngram_model.p")
+        self.calculate_probabilities(k)
+
+    def build_probabilistic_model(self):
+        """Count the n-grams of the words, with a space on each side, and their contexts"""
+        start_time = time.time()
+
+        grams = {}
+        for (word, count) in word_counts().items():
+            word = ' ' + word + ' '
+            for end in range(2, len(word) + 1):
+                for start in range(max(0, end - self.n), end):
+                    grams[word[start:end]] = grams.get(word[start:end], 0) + count
+
+        contexts = {}
+        for (gram, count) in grams.items():
+            contexts[gram[:-1]] = contexts.get(gram[:-1], 0) + count
+
+        self.model = {"grams": grams, "contexts": contexts}
+        logging.debug('Built probabilistic model in: %f', (time.time() - start_time))
+
+    def calculate_probabilities(self, k=1):
+        """Interpolate every context with the one a letter shorter, with weight k"""
+        self.k = k
+        self.__probabilities = {}
+        self.__seams = {}
+        self.__starts = {}
+
+    def probability(self, ngram):
+        """Probability of the last letter of the n-gram after the other ones"""
+        if ngram not in self.__probabilities:
+            lower = self.probability(ngram[1:]) if len(ngram) > 1 else 1 / 27
+            (grams, contexts) = (self.model["grams"], self.model["contexts"])
+            self.__probabilities[ngram] = ((grams.get(ngram, 0) + self.k * lower) /
+                    (contexts.get(ngram[:-1], 0) + self.k))
+        return self.__probabilities[ngram]
+
+    def context(self, row):
+        """Context of the next letter of a row: None in the padding, ' ' and the
+        letters of the word if it starts in the row, the last letters otherwise"""
+        if row.endswith('  '):
+            return None
+        start = max(row.rfind(' '), row.rfind('.'))
+        context = ' ' + row[start + 1:] if start >= 0 else row
+        return context[-(self.n - 1):]
+
+    def next_char(self, row, char):
+        """Probability of the next character of a row (see _normalize)"""
+        context = self.context(row)
+        if context is None:
+            if char == ' ':
+                return 1 - self.overflow
+            return self.overflow * self.probability(' ' + char)
+        if context != ' ':
+            if char == '.':
+                return self.punctuation * self.probability(context + ' ')
+            if char == ' ':
+                return (1 - self.punctuation) * self.probability(context + ' ')
+            return self.probability(context + char)
+        if char == ' ':
+            return self.line_end if row.endswith(' ') else 1 - self.punctuation
+        if char == '.':
+            return self.punctuation * (1 - self.line_end)
+        return (1 - self.line_end) * (1 - self.punctuation) * self.probability(' ' + char)
+
+    def score(self, row, text):
+        """Log probability of the text following the row"""
+        probability = 0
+        for char in text:
+            probability += math.log(self.next_char(row, char))
+            row += char
+        return probability
+
+    def end(self, row):
+        """Log probability of the line ending after the row"""
+        context = self.context(row)
+        if context is None:
+            return 0
+        word_end = self.probability(context + ' ') if context != ' ' else 1
+        return math.log(word_end * self.line_end)
+
+    def tail(self, row):
+        """Last letters of a row that are in the context of the next letter (the
+        padding, or the last word and the character before it)"""
+        if row.endswith('  '):
+            return '  '
+        start = max(row.rfind(' '), row.rfind('.'))
+        return row[start:] if 0 <= start >= len(row) - self.n + 1 else row[-(self.n - 1):]
+
+    def head(self, row):
+        """First letters of a row whose probability depends on the row before it (up
+        to the end of the first word, and the padding)"""
+        ends = [i for i in (row.find(' '), row.find('.')) if i >= 0]
+        return row[:min(max(min(ends) + 1, 2) if ends else len(row), self.n - 1)]
+
+    def seam(self, tail, head):
+        """How much more probable the head of a row is after the tail than the tail
+        ending its line and the head starting a new one (a log probability ratio).
+        Any tail and head of rows can be given, the shortest ones (see tail and head)
+        score the same"""
+        if (tail, head) not in self.__seams:
+            if head not in self.__starts:
+                self.__starts[head] = self.score(' ', head)
+            self.__seams[(tail, head)] = (self.score(tail, head) - self.__starts[head] -
+                    self.end(tail))
+        return self.__seams[(tail, head)]
+
+    def wrapping(self, rows):
+        """Log probability of the line breaks of a document: lines are broken before
+        the first word that doesn't fit in them"""
+        probability = 0
+        for (row, following) in zip(rows, rows[1:]):
+            (row, word) = (row.rstrip(), following.split(' ')[0])
+            if row and word and len(row) + 1 + len(word) <= len(rows[0]):
+                probability += math.log(self.wrong_break)
+        return probability
+
+
+def word_counts():
+    """Word counts for LetterNgrams: every word in the word list, plus the words in
+    the sample of english text (text_en.txt) as a small frequency prior"""
+    counts = dict.fromkeys(load_words(), 1)
+    cwd = os.path.dirname(__file__)
+    with open(os.path.join(cwd, "text_en.txt"), "r") as f:
+        for word in re.findall("[a-z]+", f.read().lower()):
+            counts[word] = counts.get(word, 0) + 100
+    return counts
+
+def _normalize(piece):
+    """Lowercase letters and spaces, any other character is a '.'"""
+    return ''.join(c if c in string.ascii_lowercase or c == ' ' else '.'
+            for c in piece.lower())
+
+def _best_two(scores):
+    """The two best (score, key) pairs of a dictionary"""
+    return heapq.nlargest(2, ((score, key) for (key, score) in scores.items()))
+
+
+class StripChains:
+    """Strips with the same number of rows, chained left to right into documents.
+
+    All the strips of a document are as wide, except for the last one, which can be
+    narrower. The seam between two chains is scored with LetterNgrams, on the last
+    letters of the rows of the first one and the first letters of the second one.
+    """
+
+    # Number of strips tried after each start of a chain when swapping
+    candidates = 20
+
+    def __init__(self, strips, ngrams):
+        self.strips = strips
+        self.ngrams = ngrams
+        self.pieces = [[_normalize(piece) for piece in strip] for strip in strips]
+        self.widths = [max(len(piece) for piece in strip) for strip in strips]
+        self.rows = range(len(strips[0]))
+
+        # Index of the strips by width and by the rows that start with a space
+        self.index = collections.defaultdict(set)
+        for (i, pieces) in enumerate(self.pieces):
+            spaces = sum(1 << r for (r, piece) in enumerate(pieces) if piece.startswith(' '))
+            self.index[(self.widths[i], spaces)].add(i)
+
+        (self.__tails, self.__heads, self.__seams, self.__following) = ({}, {}, {}, {})
+
+    def tails(self, chain):
+        """Tails of the rows of a chain (see LetterNgrams.tail), they only depend on
+        its last n strips"""
+        if not chain:
+            return None
+        end = tuple(chain[-self.ngrams.n:])
+        if end not in self.__tails:
+            rows = (''.join(self.pieces[i][r] for i in end) for r in self.rows)
+            self.__tails[end] = tuple(self.ngrams.tail(row) for row in rows)
+        return self.__tails[end]
+
+    def heads(self, chain):
+        """Heads of the rows of a chain (see LetterNgrams.head), they only depend on
+        its first n strips"""
+        if not chain:
+            return None
+        start = tuple(chain[:self.ngrams.n])
+        if start not in self.__heads:
+            rows = (''.join(self.pieces[i][r] for i in start) for r in self.rows)
+            self.__heads[start] = tuple(self.ngrams.head(row) for row in rows)
+        return self.__heads[start]
+
+    def following(self, chain):
+        """Strips that can be the first one of a chain following the chain: as wide as
+        its last strip or narrower, and with spaces after the padding"""
+        width = self.widths[chain[-1]]
+        if width < self.widths[chain[0]]:
+            return set()
+        tails = self.tails(chain)
+        padded = sum(1 << r for r in self.rows if tails[r].endswith('  '))
+        return set().union(*[strips for ((w, spaces), strips) in self.index.items()
+                if w <= width and spaces & padded == padded])
+
+    def fits(self, left, right):
+        """If the right chain can follow the left one: all the strips are as wide,
+        except for the last one, which can be narrower"""
+        width = self.widths[left[-1]]
+        return width == self.widths[left[0]] and (self.widths[right[0]] == width or
+                len(right) == 1 and self.widths[right[0]] < width)
+
+    def seam(self, left, right, tails=None, heads=None):
+        """Score of the right chain following the left one (0 if one of them is
+        empty), the tails and heads of the chains can be given"""
+        if not (left and right):
+            return 0
+        if not self.fits(left, right):
+            return float("-inf")
+        ends = (tails or self.tails(left), heads or self.heads(right))
+        if ends not in self.__seams:
+            self.__seams[ends] = sum(self.ngrams.seam(tail, head)
+                    for (tail, head) in zip(*ends))
+        return self.__seams[ends]
+
+    def merge(self):
+        """Join the chains that are each other's best (best buddies), the ones with
+        the biggest margin over their second best, or over not joining, first.
+
+        Only the seams with positive scores are kept, and after a join only the ones
+        of the new chain are scored again.
+        """
+        chains = dict((i, [i]) for i in range(len(self.strips)))
+        (after, before) = (dict((i, {}) for i in chains), dict((i, {}) for i in chains))
+        for a in chains:
+            self.__score_after(chains, after, before, a)
+
+        best_after = dict((c, _best_two(after[c])) for c in chains)
+        best_before = dict((c, _best_two(before[c])) for c in chains)
+        while True:
+            move = None
+            for a in chains:
+                if not best_after[a]:
+                    continue
+                (score, b) = best_after[a][0]
+                if best_before[b][0][1] != a:
+                    continue
+                seconds = best_after[a][1:] + best_before[b][1:]
+                margin = score - max([0] + [s for (s, _) in seconds])
+                if not move or margin > move[0]:
+                    move = (margin, a, b)
+            if not move:
+                return list(chains.values())
+
+            (_, a, b) = move
+            chains[a] += chains.pop(b)
+            changed = set(after[a]) | set(before[a]) | set(after[b]) | set(before[b])
+            for c in (a, b):
+                for x in after.pop(c):
+                    if x in before:
+                        before[x].pop(c, None)
+                for x in before.pop(c):
+                    if x in after:
+                        after[x].pop(c, None)
+            del best_after[b], best_before[b]
+            (after[a], before[a]) = ({}, {})
+            self.__score_after(chains, after, before, a)
+            self.__score_before(chains, after, before, a)
+            for c in (changed | set(after[a]) | set(before[a]) | {a}) - {b}:
+                best_after[c] = self.__update_best(best_after[c], after[c], c, a, b)
+                best_before[c] = self.__update_best(best_before[c], before[c], c, a, b)
+
+    def __update_best(self, best, scores, c, a, b):
+        """The two best scores of chain c after chain b joined chain a: only the
+        score with a is new, unless the best ones were with a or b"""
+        if c == a or {key for (_, key) in best} & {a, b}:
+            return _best_two(scores)
+        if a in scores:
+            return sorted(best + [(scores[a], a)], reverse=True)[:2]
+        return best
+
+    def __score_after(self, chains, after, before, a):
+        """Score the chains that can follow chain a"""
+        for b in self.following(chains[a]):
+            if b in chains and b != a:
+                score = self.seam(chains[a], chains[b])
+                if score > 0:
+                    after[a][b] = before[b][a] = score
+
+    def __score_before(self, chains, after, before, a):
+        """Score the chains that chain a can follow"""
+        for b in chains:
+            if b != a:
+                score = self.seam(chains[b], chains[a])
+                if score > 0:
+                    after[b][a] = before[a][b] = score
+
+    def swap(self, chains):
+        """Swap the ends of two chains while it makes the documents more probable.
+
+        A greedy join can't be undone: if a chain took the strips of another document,
+        that one is left with an end that no strip can follow. Swapping the ends of the
+        two chains repairs it (an empty end splits or joins them), and so does putting
+        a chain that was skipped back between two strips. The line breaks of the
+        documents are scored too (see LetterNgrams.wrapping).
+
+        Only the strips that follow each start of a chain best are tried (see
+        candidates), and after a swap only the swaps of the new chains are tried again.
+        """
+        chains = set(tuple(chain) for chain in chains)
+        (kept, moves, changed) = ({}, [], set(chains))
+        wanted = collections.defaultdict(set)
+        while changed:
+            for chain in changed:
+                for j in range(len(chain) + 1):
+                    kept[(chain, j)] = self.seam(chain[:j], chain[j:])
+                    for s in self.__candidates(chain[:j]):
+                        wanted[s].add((chain, j))
+
+            where = dict((s, (chain, j)) for chain in chains for (j, s) in enumerate(chain))
+            tried = set((left, i, s) for right in changed for s in right
+                    for (left, i) in wanted[s] if left in chains)
+            tried |= set((left, i, s) for left in changed for i in range(1, len(left) + 1)
+                    for s in self.__candidates(left[:i]))
+            for (left, i, s) in tried:
+                (right, j) = where[s]
+                if right == left:
+                    continue
+                # The new chains and their new seams: the ends swapped, or the right
+                # chain put in the cut of the left one
+                swaps = [((left[:i] + right[j:], right[:j] + left[i:]),
+                        [(left[:i], right[j:]), (right[:j], left[i:])])]
+                if j == 0:
+                    swaps.append(((left[:i] + right + left[i:],),
+                            [(left[:i], right), (left[:i] + right, left[i:])]))
+                for (new, seams) in swaps:
+                    score = self.__swap_score(left, i, right, j, new, seams, kept)
+                    # Swaps that undo others score a rounding error above 0
+                    if score > 1e-9:
+                        moves.append((score, left, right, new))
+
+            (swapped, changed) = (set(), set())
+            for (_, left, right, new) in sorted(moves, reverse=True):
+                if not swapped & {left, right}:
+                    swapped |= {left, right}
+                    changed |= set(new) - {()}
+            chains = (chains - swapped) | changed
+            moves = [move for move in moves if not swapped & {move[1], move[2]}]
+        return [list(chain) for chain in chains]
+
+    def __candidates(self, chain):
+        """The strips that follow the chain best (none if it's empty)"""
+        if not chain:
+            return []
+        if chain not in self.__following:
+            scores = dict((s, self.seam(chain, (s,))) for s in self.following(chain))
+            self.__following[chain] = heapq.nlargest(self.candidates, scores, key=scores.get)
+        return self.__following[chain]
+
+    def __swap_score(self, left, i, right, j, new, seams, kept):
+        """Score of replacing two chains, cut after their i-th and j-th strips, with
+        new ones that have the given new seams"""
+        score = (sum(self.seam(a, b) for (a, b) in seams) -
+                kept[(left, i)] - kept[(right, j)])
+        if score > 0:
+            score += (sum(self.wrapping(chain) for chain in new) -
+                    self.wrapping(left) - self.wrapping(right))
+        return score
+
+    def wrapping(self, chain):
+        """Log probability of the line breaks of a chain (0 if it's empty)"""
+        if not chain:
+            return 0
+        return self.ngrams.wrapping([''.join(self.pieces[i][r] for i in chain)
+                for r in self.rows])
+
+    def documents(self):
+        """The strips of each document, left to right"""
+        return [[self.strips[i] for i in chain] for chain in self.swap(self.merge())]
+
+def group_strips(strips, ngrams=None):
+    """Split a pool of strips from many documents into one group per document.
+
+    Strips are indexed by row count: strips from the same document have the same
+    number of rows. Strips with the same number of rows are then chained into
+    documents with the letter n-grams (see StripChains).
+    Strips must have at least one row.
+    """
+    ngrams = ngrams if ngrams else LetterNgrams()
+
+    by_rows = collections.defaultdict(list)
+    for strip in strips:
+        if not strip:
+            raise ValueError("Strips must have at least one row")
+        by_rows[len(strip)].append(strip)
+
+    groups = []
+    for (rows, bucket) in by_rows.items():
+        documents = StripChains(bucket, ngrams).documents()
+        logging.debug("%d strips with %d rows: %d documents", len(bucket), rows,
+                len(documents))
+        groups.extend(documents)
+
+    return groups
+
+# Word model of the worker processes of reassemble
+_worker_unigrams = None
+
+def _init_worker(unigrams):
+    global _worker_unigrams
+    _worker_unigrams = unigrams
+
+def _solve_group(columns):
+    if len(columns) > 1:
+        results = most_probable(columns=columns, cols=len(columns), rows=len(columns[0]),
+                unigrams=_worker_unigrams)
+        if results[0][1]:
+            return results[0][1]
+    # One column, or none that can be the first one: keep the order of the group
+    return ShuffledText(columns=columns, cols=len(columns), rows=len(columns[0]), text=None,
+            unigrams=_worker_unigrams)
+
+def reassemble(strips, processes=None, unigrams=None, ngrams=None):
+    """Group a pool of strips from many documents and reorder each one in parallel.
+
+    The strips are grouped with the letter n-grams (see group_strips), and each
+    group is reordered with the word unigrams (see most_probable).
+    Returns the most probable ShuffledText for each group.
+    """
+    start_time = time.time()
+    # Build the model here: if it fails, it raises instead of killing the workers
+    unigrams = unigrams if unigrams else WordUnigrams()
+    groups = group_strips(strips, ngrams)
+
+    with multiprocessing.Pool(processes, initializer=_init_worker,
+            initargs=(unigrams,)) as pool:
+        documents = pool.map(_solve_group, groups)
+
+    logging.debug('Reassembled %d documents in: %f', len(documents),
+            (time.time() - start_time))
+    return documents
+
 def main():
     sorted_results = most_probable()
     logging.debug(sorted_results)
@@ -81,6 +81,28 @@ class TestLetterBigrams(unittest.TestCase):
         self.assertEqual(self.lbg.probability("za"), 0.0007964330846589955)
 
 
+class TestDictionaryIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = rcplm.DictionaryIndex()
+
+    def test_index_is_shared(self):
+        self.assertIs(rcplm.DictionaryIndex().words, self.index.words)
+
+    def test_contains(self):
+        self.assertIn("parrot", self.index)
+        self.assertNotIn("paarroott", self.index)
+
+    def test_coverage(self):
+        self.assertEqual(self.index.coverage("this is a test"), 10/11)
+        self.assertEqual(self.index.coverage("uijt jt b uftu"), 0)
+        self.assertEqual(self.index.coverage(""), 0)
+
+    def test_coverages(self):
+        phrases = ["this is a test", "uijt jt b uftu", "test this", ""]
+        self.assertEqual(self.index.coverages(phrases), [10/11, 0, 1, 0])
+
+
 class TestDecoder(unittest.TestCase):
 
     def setUp(self):
@@ -97,5 +119,13 @@ of God they have decided to fight for it"
         self.assertEqual(sorted_phrases[0][0], 2.3102527364450072e-156)
         self.assertEqual(sorted_phrases[1][0], 2.7518911947067603e-214)
 
+    def test_prune(self):
+        phrases = rcplm.prune(self.phrases)
+        self.assertEqual(phrases, [self.phrase.lower()])
+
+    def test_prune_keeps_best(self):
+        phrases = rcplm.prune(self.phrases, threshold=1.1)
+        self.assertEqual(phrases, [self.phrase.lower()])
+
 if __name__ == '__main__':
     unittest.main()
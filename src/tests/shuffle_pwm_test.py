@@ -5,11 +5,18 @@ __license__ = "BSD-new"
 
 from .. import shuffle_pwm
 import unittest
+import collections
 import math
 import os.path
+import random
+import re
 
 cwd = os.path.dirname(__file__)
 
+# The word unigrams need the word counts (or their pickle)
+has_word_counts = (os.path.isfile(os.path.join(cwd, "..", "count_1w.txt")) or
+        os.path.isfile(os.path.join(cwd, "..", ".prob_word_model.p")))
+
 TEST_TEXT = """
 th|is| i|s |a |
 te|st| f|or|  |
@@ -124,6 +131,133 @@ class TestShufflePwm(unittest.TestCase):
         self.assertIsNotNone(results)
         self.assertEquals(str(results[0][1]), "this is a \ntest for  \nthis class\n")
 
+    @unittest.skipUnless(has_word_counts, "count_1w.txt not found")
+    def test_most_probable_columns(self):
+        columns = shuffle_pwm.ShuffledText(text=self.text, cols=5, rows=3).columns
+        results = shuffle_pwm.most_probable(columns=columns, cols=5, rows=3)
+        self.assertEquals(str(results[0][1]), "this is a \ntest for  \nthis class\n")
+        self.assertEquals(len(columns), 5)
+
+
+class TestLetterNgrams(unittest.TestCase):
+
+    def setUp(self):
+        self.lng = shuffle_pwm.LetterNgrams()
+
+    def test_probability(self):
+        self.assertGreater(self.lng.probability(" th"), self.lng.probability(" tz"))
+        self.assertGreater(self.lng.probability("ing "), self.lng.probability("inq "))
+        self.assertGreater(self.lng.probability("e"), self.lng.probability("q"))
+
+    def test_context(self):
+        self.assertEquals(self.lng.context("the qu"), " qu")
+        self.assertEquals(self.lng.context("hat. qu"), " qu")
+        self.assertEquals(self.lng.context("the "), " ")
+        self.assertEquals(self.lng.context("historical"), "rical")
+        self.assertIsNone(self.lng.context("the  "))
+
+    def test_next_char(self):
+        self.assertEquals(self.lng.next_char("the ", " "), self.lng.line_end)
+        self.assertEquals(self.lng.next_char("the  ", " "), 1 - self.lng.overflow)
+        self.assertLess(self.lng.next_char("the  ", "a"), self.lng.overflow)
+
+    def test_tail_head(self):
+        self.assertEquals(self.lng.tail("of the qu"), " qu")
+        self.assertEquals(self.lng.tail("the  "), "  ")
+        self.assertEquals(self.lng.tail("historical"), "rical")
+        self.assertEquals(self.lng.head("ick brown"), "ick ")
+        self.assertEquals(self.lng.head(" brown"), " b")
+        self.assertEquals(self.lng.head("historical"), "histo")
+
+    def test_seam(self):
+        self.assertGreater(self.lng.seam(" wri", "te "), self.lng.seam(" wri", "nte "))
+        self.assertGreater(self.lng.seam(" th", "e "), self.lng.seam(" th", " the"))
+        self.assertLess(self.lng.seam("  ", "an"), 0)
+        self.assertEquals(self.lng.seam(" wri", "te "), self.lng.score(" wri", "te ") -
+                self.lng.score(" ", "te ") - self.lng.end(" wri"))
+
+    def test_wrapping(self):
+        self.assertEquals(self.lng.wrapping(["the quick ", "brown fox "]), 0)
+        self.assertEquals(self.lng.wrapping(["the       ", "fox jumps "]),
+                math.log(self.lng.wrong_break))
+
+
+class TextPrefixes:
+    """Word model for the tests, without count_1w.txt: the probability of a word is
+    the one of the words it starts in text_en.txt, so the order of the columns of a
+    text can be figured out a column at a time"""
+
+    def __init__(self):
+        with open(os.path.join(cwd, "..", "text_en.txt"), "r") as f:
+            words = re.findall("[a-z]+", f.read().lower())
+        self.total = len(words)
+        self.prefixes = collections.Counter(w[:i] for w in words for i in range(1, len(w) + 1))
+
+    def probability(self, word):
+        return (self.prefixes.get(word, 0) + 0.01) / self.total
+
+
+class TestReassemble(unittest.TestCase):
+
+    def passages(self, count, rows=8, width=19):
+        """count passages of text_en.txt, spread across the text, wrapped to width"""
+        with open(os.path.join(cwd, "..", "text_en.txt"), "r") as f:
+            words = f.read().split()
+        lines = ['']
+        for word in words:
+            if lines[-1] and len(lines[-1]) + 1 + len(word) > width:
+                lines.append(word)
+            else:
+                lines[-1] = (lines[-1] + ' ' + word).strip()
+        step = len(lines) // count
+        passages = [lines[i:i + rows] for i in range(0, step * count, step)]
+        return [[line.ljust(max(map(len, p))) for line in p] for p in passages]
+
+    def cut(self, lines, width=2):
+        return [[line[c:c + width] for line in lines] for c in range(0, len(lines[0]), width)]
+
+    def shuffle(self, documents, seed=0):
+        strips = [strip for document in documents for strip in document]
+        random.Random(seed).shuffle(strips)
+        return strips
+
+    def assertGroups(self, groups, documents):
+        self.assertEquals(sorted(sorted(g) for g in groups), sorted(sorted(d) for d in documents))
+
+    def test_group_strips_text(self):
+        columns = shuffle_pwm.ShuffledText(unigrams=TextPrefixes()).columns
+        for seed in range(3):
+            groups = shuffle_pwm.group_strips(self.shuffle([columns], seed))
+            self.assertGroups(groups, [columns])
+
+    def test_group_strips_passages(self):
+        documents = [self.cut(passage) for passage in self.passages(6)]
+        groups = shuffle_pwm.group_strips(self.shuffle(documents))
+        self.assertGroups(groups, documents)
+
+    def test_group_strips_widths(self):
+        passages = self.passages(2)
+        documents = [self.cut(passages[0], 2), self.cut(passages[1], 3)]
+        groups = shuffle_pwm.group_strips(self.shuffle(documents))
+        self.assertGroups(groups, documents)
+
+    def test_group_strips_by_rows(self):
+        unigrams = TextPrefixes()
+        documents = [shuffle_pwm.ShuffledText(unigrams=unigrams).columns,
+                shuffle_pwm.ShuffledText(text=TEST_TEXT, cols=5, rows=3, unigrams=unigrams).columns]
+        groups = shuffle_pwm.group_strips(self.shuffle(documents))
+        self.assertGroups(groups, documents)
+
+    def test_group_strips_empty(self):
+        self.assertRaises(ValueError, shuffle_pwm.group_strips, [["th", "te"], []])
+
+    def test_reassemble(self):
+        documents = self.passages(6)[2:4]
+        strips = self.shuffle([self.cut(passage) for passage in documents])
+        results = shuffle_pwm.reassemble(strips, processes=2, unigrams=TextPrefixes())
+        self.assertEquals(sorted(str(r) for r in results),
+                sorted('\n'.join(passage) + '\n' for passage in documents))
+
 
 if __name__ == '__main__':
     unittest.main()